@@ -1,11 +1,11 @@
 # dashboard.py
 import os
-import json
-import math
-import hashlib
+import re
+import numpy as np
 import pandas as pd
 import folium
-from folium.plugins import HeatMap
+from folium.plugins import HeatMap, FastMarkerCluster
+from json_cache import load_json_cached
 
 # --- Centróides aproximados das UFs (usados como fallback) ---
 UF_CENTROIDS = {
@@ -18,75 +18,87 @@ UF_CENTROIDS = {
     "SP": [-23.55, -46.63], "SE": [-10.90, -37.07], "TO": [-10.25, -48.32]
 }
 
-def _deterministic_jitter(seed_text: str, lat_range=0.6, lon_range=0.9):
-    """Gera deslocamento determinístico (reprodutível) a partir de um texto."""
-    h = hashlib.md5(seed_text.encode('utf-8')).hexdigest()
-    lat_frac = int(h[0:8], 16) / 0xFFFFFFFF
-    lon_frac = int(h[8:16], 16) / 0xFFFFFFFF
+def _deterministic_jitter(seed_texts, lat_range=0.6, lon_range=0.9):
+    """Gera deslocamentos determinísticos (reprodutíveis) a partir de textos.
+
+    Recebe um array/Series de textos e devolve dois arrays (lat_off, lon_off),
+    um hash de 64 bits por chave fatiado em duas frações de 32 bits.
+    """
+    h = pd.util.hash_array(np.asarray(seed_texts, dtype=object))
+    lat_frac = (h & 0xFFFFFFFF).astype(np.float64) / 0xFFFFFFFF
+    lon_frac = (h >> 32).astype(np.float64) / 0xFFFFFFFF
     lat_off = (lat_frac - 0.5) * 2 * lat_range
     lon_off = (lon_frac - 0.5) * 2 * lon_range
     return lat_off, lon_off
 
-def _try_parse_point_string(s):
-    """Tenta extrair lat,lon de strings comuns (POINT(), 'lat,lon', 'lon lat')."""
-    try:
-        s2 = str(s).strip()
-        if not s2:
-            return None
-        # POINT(lon lat) ou POINT (lon lat)
-        if s2.lower().startswith("point"):
-            inside = s2[s2.find("(")+1:s2.rfind(")")]
-            parts = inside.replace(",", " ").split()
-            if len(parts) >= 2:
-                lon, lat = float(parts[0]), float(parts[1])
-                return lat, lon
-        # formato "lat,lon" ou "lon,lat"
-        if "," in s2:
-            a, b = s2.split(",", 1)
-            try:
-                a_f = float(a.strip())
-                b_f = float(b.strip())
-                # heurística de ordem: lat geralmente entre -40..10, lon entre -80..-30
-                if -40 <= a_f <= 10 and -80 <= b_f <= -30:
-                    return a_f, b_f
-                if -40 <= b_f <= 10 and -80 <= a_f <= -30:
-                    return b_f, a_f
-                # se não tiver certeza, só retorna (a,b)
-                return a_f, b_f
-            except Exception:
-                pass
-        # formato "lat lon" (espaço)
-        parts = s2.split()
-        if len(parts) >= 2:
-            try:
-                p1 = float(parts[0]); p2 = float(parts[1])
-                if -40 <= p1 <= 10 and -80 <= p2 <= -30:
-                    return p1, p2
-                if -40 <= p2 <= 10 and -80 <= p1 <= -30:
-                    return p2, p1
-            except Exception:
-                pass
-    except Exception:
-        pass
-    return None
+# dois números separados por vírgula/espaço (cobre POINT(), 'lat,lon', 'lon lat')
+_POINT_RE = re.compile(r'(-?\d+(?:\.\d+)?)[\s,]+(-?\d+(?:\.\d+)?)')
+
+def _parse_point_series(s):
+    """Extrai lat,lon de uma Series de strings comuns (POINT(), 'lat,lon', 'lon lat').
+
+    Retorna DataFrame com colunas ['lat','lon'] apenas das linhas parseáveis.
+    """
+    txt = s.astype(str).str.strip()
+    ext = txt.str.extract(_POINT_RE)
+    a = pd.to_numeric(ext[0], errors='coerce')
+    b = pd.to_numeric(ext[1], errors='coerce')
+    # POINT(lon lat) lista longitude primeiro; nos demais formatos usa a
+    # heurística de ordem: lat geralmente entre -40..10, lon entre -80..-30
+    a_is_lat = (-40 <= a) & (a <= 10) & (-80 <= b) & (b <= -30)
+    b_is_lat = (-40 <= b) & (b <= 10) & (-80 <= a) & (a <= -30)
+    swap = txt.str.lower().str.startswith("point") | (b_is_lat & ~a_is_lat)
+    lat = np.where(swap, b, a)
+    lon = np.where(swap, a, b)
+    valid = np.isfinite(lat) & np.isfinite(lon)
+    return pd.DataFrame({'lat': lat[valid], 'lon': lon[valid]})
+
+# HTML renderizado em cache: a serialização do mapa folium é o custo
+# dominante e os inputs só mudam quando os arquivos mudam no disco
+_heatmap_cache = {}
 
-def create_heatmap():
+def invalidate_heatmap_cache():
+    """Descarta o HTML de heatmap em cache (bust explícito)."""
+    _heatmap_cache.clear()
+
+def create_heatmap(grid_deg=0.05):
     """
     Lê 'datatran_consolidado.json' no diretório atual e gera:
     - um HeatMap ponderado por número de registros por município (quando não há coordenadas por registro),
     - OU um HeatMap direto por pontos (se o JSON tiver latitude/longitude por registro).
+    `grid_deg` é a resolução (em graus) da grade de pré-agregação dos pontos diretos.
     Retorna HTML (string) com o mapa e um painel lateral com quantitativos.
+    O HTML final fica em cache chaveado no mtime dos arquivos de entrada.
     """
     datapath = "datatran_consolidado.json"
     municipios_coords_file = "municipios_coords.json"  # opcional (se tiver coords reais por cidade)
 
+    try:
+        key = (
+            grid_deg,
+            os.path.getmtime(datapath),
+            os.path.getmtime(municipios_coords_file) if os.path.exists(municipios_coords_file) else 0,
+        )
+    except OSError:
+        key = None  # sem arquivo de dados: a renderização devolve a mensagem padrão
+    if key is not None and key in _heatmap_cache:
+        return _heatmap_cache[key]
+
+    html = _render_heatmap(datapath, municipios_coords_file, grid_deg)
+    if key is not None:
+        # guarda apenas a versão corrente dos arquivos; mtimes antigos não acumulam
+        _heatmap_cache.clear()
+        _heatmap_cache[key] = html
+    return html
+
+def _render_heatmap(datapath, municipios_coords_file, grid_deg):
+    """Renderiza de fato o mapa + painel (caminho sem cache)."""
     try:
         if not os.path.exists(datapath):
             return '<div style="padding:20px;">Arquivo <b>datatran_consolidado.json</b> não encontrado no diretório.</div>'
 
-        # carregar JSON
-        with open(datapath, 'r', encoding='utf-8') as f:
-            raw = json.load(f)
+        # carregar JSON (cacheado por mtime — recarrega só quando o arquivo muda)
+        raw = load_json_cached(datapath)
 
         df = pd.DataFrame(raw)
         if df.empty:
@@ -103,30 +115,37 @@ def create_heatmap():
         if lat_cols and lon_cols:
             latc = cols_lower[lat_cols[0]]
             lonc = cols_lower[lon_cols[0]]
-            for _, row in df.iterrows():
-                try:
-                    lat = float(row.get(latc))
-                    lon = float(row.get(lonc))
-                    if math.isfinite(lat) and math.isfinite(lon):
-                        coords_points.append([lat, lon, 1])
-                except Exception:
-                    pass
+            lat = pd.to_numeric(df[latc], errors='coerce').to_numpy(dtype=float)
+            lon = pd.to_numeric(df[lonc], errors='coerce').to_numpy(dtype=float)
+            m = np.isfinite(lat) & np.isfinite(lon)
+            if m.any():
+                coords_points = np.column_stack([lat[m], lon[m], np.ones(int(m.sum()))]).tolist()
 
         # se não encontrou lat/lon explícitos, tentar colunas tipo geometry/point
         if not coords_points:
             geom_candidates = [k for k in cols_lower if any(x in k for x in ['geom','geometry','point','coord','coorden'])]
             for g in geom_candidates:
-                for _, row in df.iterrows():
-                    parsed = _try_parse_point_string(row.get(cols_lower[g], ''))
-                    if parsed:
-                        lat, lon = parsed
-                        coords_points.append([lat, lon, 1])
+                pts = _parse_point_series(df[cols_lower[g]])
+                if not pts.empty:
+                    coords_points.extend(
+                        np.column_stack([pts['lat'], pts['lon'], np.ones(len(pts))]).tolist()
+                    )
 
-        # Se encontramos pontos diretos, desenhar heatmap com eles e resumir total
+        # Se encontramos pontos diretos, pré-agregar numa grade espacial e
+        # desenhar o heatmap com os centros das células ponderados — o blur do
+        # cliente já suaviza a discretização e o payload cai de N pontos para
+        # o número de células ocupadas
         if coords_points:
-            m = folium.Map(location=[-14.2350, -51.9253], zoom_start=4, tiles='OpenStreetMap')
-            HeatMap(coords_points, radius=6, blur=10, min_opacity=0.25).add_to(m)
             total = len(coords_points)
+            pts = np.asarray(coords_points, dtype=float)
+            cells = pd.DataFrame({
+                'lat': np.round(pts[:, 0] / grid_deg) * grid_deg,
+                'lon': np.round(pts[:, 1] / grid_deg) * grid_deg,
+                'w': pts[:, 2]
+            }).groupby(['lat', 'lon'], as_index=False)['w'].sum()
+
+            m = folium.Map(location=[-14.2350, -51.9253], zoom_start=4, tiles='OpenStreetMap')
+            HeatMap(cells.to_numpy().tolist(), radius=6, blur=10, min_opacity=0.25).add_to(m)
             summary_html = f"<div style='padding:12px;font-family:Segoe UI, sans-serif;'><h3>Total registros</h3><p style='font-size:18px'>{total}</p></div>"
             return f'<div style="display:flex;gap:12px;align-items:flex-start">' \
                    f'<div style="flex:1">{m._repr_html_()}</div>' \
@@ -158,10 +177,18 @@ def create_heatmap():
         if uf_col is None or mun_col is None:
             return '<div style="padding:20px;">Não foi possível identificar colunas de <b>UF</b> e <b>Município</b> no JSON.</div>'
 
-        # normalizar strings e agregar
+        # normalizar strings e agregar (value_counts funde contagem+ordenação
+        # e já devolve em ordem decrescente)
         df['uf_norm'] = df[uf_col].astype(str).str.strip().str.upper()
         df['mun_norm'] = df[mun_col].astype(str).str.strip()
-        agg = df.groupby(['uf_norm', 'mun_norm']).size().reset_index(name='count')
+        # category: as chaves de agrupamento viram códigos inteiros em vez de
+        # comparações/hashes de string por linha
+        df[['uf_norm', 'mun_norm']] = df[['uf_norm', 'mun_norm']].astype('category')
+        # com categorias o value_counts enumera também combinações não
+        # observadas — descartá-las antes de prosseguir
+        pair_counts = df[['uf_norm', 'mun_norm']].value_counts()
+        pair_counts = pair_counts[pair_counts > 0]
+        agg = pair_counts.rename('count').reset_index()
         if agg.empty:
             return '<div style="padding:20px;">Nenhum registro válido após agregação por UF/Município.</div>'
 
@@ -169,52 +196,79 @@ def create_heatmap():
         municipios_coords = {}
         if os.path.exists(municipios_coords_file):
             try:
-                with open(municipios_coords_file, 'r', encoding='utf-8') as f:
-                    municipios_coords = json.load(f)
+                municipios_coords = load_json_cached(municipios_coords_file)
             except Exception:
                 municipios_coords = {}
 
         # preparar pontos ponderados por count
-        heat_points = []
         m = folium.Map(location=[-14.2350, -51.9253], zoom_start=4, tiles='OpenStreetMap')
-        markers = folium.FeatureGroup(name="Cidades", show=False)
 
-        for _, row in agg.iterrows():
-            uf = row['uf_norm']
-            mun = row['mun_norm']
-            cnt = int(row['count'])
-            lat = lon = None
+        ufs = agg['uf_norm'].to_numpy()
+        muns = agg['mun_norm'].to_numpy()
+        counts = agg['count'].to_numpy()
 
-            # procurar em municipios_coords: estrutura esperada { "SP": {"São Paulo":[lat,lon], ...}, ... }
+        # procurar em municipios_coords: estrutura esperada { "SP": {"São Paulo":[lat,lon], ...}, ... }
+        def _lookup_coords(uf, mun):
             try:
-                if municipios_coords:
-                    if uf in municipios_coords and mun in municipios_coords[uf]:
-                        lat, lon = municipios_coords[uf][mun]
-                    elif f"{uf}|{mun}" in municipios_coords:
-                        lat, lon = municipios_coords[f"{uf}|{mun}"]
-                    elif mun in municipios_coords:
-                        lat, lon = municipios_coords[mun]
+                if uf in municipios_coords and mun in municipios_coords[uf]:
+                    lat, lon = municipios_coords[uf][mun]
+                elif f"{uf}|{mun}" in municipios_coords:
+                    lat, lon = municipios_coords[f"{uf}|{mun}"]
+                elif mun in municipios_coords:
+                    lat, lon = municipios_coords[mun]
+                else:
+                    return (np.nan, np.nan)
+                # valida aqui: entrada malformada degrada só esta linha
+                return (float(lat), float(lon))
             except Exception:
-                lat = lon = None
-
-            # fallback: centróide + jitter determinístico
-            if lat is None or lon is None:
-                centro = UF_CENTROIDS.get(uf, [-14.2350, -51.9253])
-                lat_off, lon_off = _deterministic_jitter(f"{uf}|{mun}", lat_range=0.6, lon_range=0.9)
-                lat = centro[0] + lat_off
-                lon = centro[1] + lon_off
-
-            heat_points.append([lat, lon, cnt])
-
-            folium.CircleMarker(
-                location=(lat, lon),
-                radius=max(3, min(12, math.sqrt(cnt) * 1.5)),
-                popup=f"{mun} ({uf}) — {cnt} registros",
-                tooltip=f"{mun} — {cnt}",
-                fill=True,
-                fill_opacity=0.8,
-                weight=0
-            ).add_to(markers)
+                return (np.nan, np.nan)
+
+        if municipios_coords:
+            known = np.array([_lookup_coords(u, mn) for u, mn in zip(ufs, muns)], dtype=float)
+        else:
+            known = np.full((len(agg), 2), np.nan)
+
+        # fallback vetorizado: centróide da UF + jitter determinístico.
+        # A tabela de centróides é montada só por categoria e expandida por
+        # fancy-indexing dos códigos — nenhum lookup de dict por linha.
+        uf_cats = agg['uf_norm'].cat.categories
+        cent_table = np.array(
+            [UF_CENTROIDS.get(u, [-14.2350, -51.9253]) for u in uf_cats], dtype=float
+        )
+        centroids = cent_table[agg['uf_norm'].cat.codes.to_numpy()]
+        lat_offs, lon_offs = _deterministic_jitter(
+            (agg['uf_norm'].astype(str) + '|' + agg['mun_norm'].astype(str)).to_numpy(),
+            lat_range=0.6, lon_range=0.9
+        )
+        lats = np.where(np.isfinite(known[:, 0]), known[:, 0], centroids[:, 0] + lat_offs)
+        lons = np.where(np.isfinite(known[:, 1]), known[:, 1], centroids[:, 1] + lon_offs)
+        radii = np.clip(np.sqrt(counts) * 1.5, 3, 12)
+
+        heat_points = np.column_stack([lats, lons, counts]).tolist()
+
+        # marcadores serializados de uma vez como JSON e construídos no
+        # navegador, em vez de um objeto Leaflet por linha no Python
+        marker_data = [
+            [la, lo, r, f"{mun} ({uf}) — {cnt} registros", f"{mun} — {cnt}"]
+            for (la, lo, r), mun, uf, cnt in zip(
+                np.column_stack([lats, lons, radii]).tolist(), muns, ufs, counts
+            )
+        ]
+        markers = FastMarkerCluster(
+            marker_data,
+            callback="""
+                function (row) {
+                    var marker = L.circleMarker([row[0], row[1]], {
+                        radius: row[2], fill: true, fillOpacity: 0.8, weight: 0
+                    });
+                    marker.bindPopup(row[3]);
+                    marker.bindTooltip(row[4]);
+                    return marker;
+                }
+            """,
+            name="Cidades",
+            show=False
+        )
 
         if heat_points:
             HeatMap(heat_points, radius=10, blur=18, min_opacity=0.2, max_zoom=6).add_to(m)
@@ -222,18 +276,19 @@ def create_heatmap():
             folium.LayerControl(collapsed=True).add_to(m)
 
         # painel lateral com resumo: top 15 municípios e total por UF
-        top_n = agg.sort_values('count', ascending=False).head(15)
-        top_html = "<h3 style='margin-top:0;'>Top 15 Municípios</h3><ol style='padding-left:16px;'>"
-        for _, r in top_n.iterrows():
-            top_html += f"<li>{r['mun_norm']} ({r['uf_norm']}) — <b>{int(r['count'])}</b></li>"
-        top_html += "</ol>"
+        top_n = agg.head(15)  # agg já está ordenado por count decrescente
+        top_items = ''.join(
+            f"<li>{mun} ({uf}) — <b>{cnt}</b></li>"
+            for mun, uf, cnt in zip(top_n['mun_norm'], top_n['uf_norm'], top_n['count'])
+        )
+        top_html = f"<h3 style='margin-top:0;'>Top 15 Municípios</h3><ol style='padding-left:16px;'>{top_items}</ol>"
 
         total_registros = int(agg['count'].sum())
-        per_uf = agg.groupby('uf_norm')['count'].sum().reset_index().sort_values('count', ascending=False)
-        uf_html = "<h4>Por UF</h4><ul style='padding-left:16px;'>"
-        for _, r in per_uf.iterrows():
-            uf_html += f"<li>{r['uf_norm']}: {int(r['count'])}</li>"
-        uf_html += "</ul>"
+        per_uf = pair_counts.groupby(level=0).sum().rename('count').reset_index().sort_values('count', ascending=False)
+        uf_items = ''.join(
+            f"<li>{uf}: {cnt}</li>" for uf, cnt in zip(per_uf['uf_norm'], per_uf['count'])
+        )
+        uf_html = f"<h4>Por UF</h4><ul style='padding-left:16px;'>{uf_items}</ul>"
 
         summary_html = f"""
             <div style="padding:12px;font-family:Segoe UI, sans-serif;">
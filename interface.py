@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
-import json
 import pickle
+import lightgbm as lgb
+import concurrent.futures
 from datetime import datetime, date, time
+from json_cache import load_json_cached
 from preditor_ofc import AccidentPredictor
 
 # -------------------------
@@ -23,7 +25,10 @@ def load_model(pickle_path="modelo_acidentes.pkl"):
     predictor = AccidentPredictor()
 
     # Compatibilidade com diferentes formatos de pickle
-    predictor.modelo = data.get("modelo", data.get("model", predictor.modelo))
+    if data.get("booster_str"):
+        predictor.modelo = lgb.Booster(model_str=data["booster_str"])
+    else:
+        predictor.modelo = data.get("modelo", data.get("model", predictor.modelo))
     predictor.encoders = data.get("encoders", getattr(data, "encoders", {}))
     predictor.feature_names = data.get("features", data.get("feature_names", getattr(data, "feature_names", [])))
     predictor.best_params = data.get("params", data.get("best_params", {}))
@@ -32,6 +37,55 @@ def load_model(pickle_path="modelo_acidentes.pkl"):
     predictor.rmse_score_test = data.get("rmse_test", data.get("rmse", None))
     # Carrega o histórico (necessário para calcular lags e médias na previsão e para o contexto)
     predictor.historical_df = data.get("historical_df", None)
+    if predictor.historical_df is None and data.get("historical_path"):
+        try:
+            # só as colunas que a interface realmente consulta
+            predictor.historical_df = pd.read_parquet(
+                data["historical_path"], columns=["data", "acidentes", "municipio"]
+            )
+        except Exception:
+            try:
+                predictor.historical_df = pd.read_parquet(data["historical_path"])
+            except Exception:
+                predictor.historical_df = None
+    # Resolve a última data do histórico uma única vez no load; cada clique
+    # de previsão passa a ler um escalar em vez de re-parsear a coluna toda
+    predictor._last_hist_date = None
+    hist = predictor.historical_df
+    if isinstance(hist, pd.DataFrame) and "data" in hist.columns and not hist.empty:
+        datas = hist["data"]
+        if not pd.api.types.is_datetime64_any_dtype(datas):
+            datas = pd.to_datetime(datas, errors="coerce")
+        ultima = datas.max()
+        if pd.notna(ultima):
+            predictor._last_hist_date = ultima
+
+    # Agregados do histórico consultados pelo expander: médias por município,
+    # média global e últimos 7 dias — nada disso depende do input do usuário,
+    # então sai do caminho do clique
+    predictor._global_mean = None
+    predictor._mean_by_mun = {}
+    predictor._last7 = None
+    if isinstance(hist, pd.DataFrame) and "acidentes" in hist.columns:
+        predictor._global_mean = hist["acidentes"].mean()
+        if "municipio" in hist.columns:
+            # observed=True + dropna: municípios sem histórico caem na média
+            # global em vez de aparecerem com média NaN
+            predictor._mean_by_mun = (
+                hist.groupby("municipio", observed=True)["acidentes"].mean().dropna().to_dict()
+            )
+        if "data" in hist.columns:
+            predictor._last7 = (
+                hist.sort_values("data", ascending=False)
+                .head(7)[["data", "acidentes"]]
+                .reset_index(drop=True)
+            )
+            # string de exibição resolvida uma vez aqui — o clique não faz
+            # nenhum pd.to_datetime
+            predictor._last7["data_str"] = pd.to_datetime(
+                predictor._last7["data"], errors="coerce"
+            ).dt.strftime("%d/%m/%Y")
+
     predictor.treinado = True
     return predictor
 
@@ -40,40 +94,56 @@ def load_model(pickle_path="modelo_acidentes.pkl"):
 # -------------------------
 @st.cache_data
 def load_options():
-    try:
-        with open("uf_options.json", "r", encoding="utf-8") as f:
-            uf_options = json.load(f)
-    except Exception:
-        uf_options = []
+    def _load_one(path, default):
+        try:
+            # json_cache usa orjson quando disponível (parser nativo) e
+            # memoiza por mtime
+            return load_json_cached(path)
+        except Exception:
+            return default
 
-    try:
-        with open("municipios_por_uf.json", "r", encoding="utf-8") as f:
-            municipios_por_uf = json.load(f)
-    except Exception:
-        municipios_por_uf = {}
+    def _load_municipios():
+        # a tabela grande vem de Parquet colunar quando disponível (leitura
+        # bem mais rápida que o JSON equivalente); o JSON segue como fallback
+        try:
+            tabela = pd.read_parquet("municipios_por_uf.parquet")
+            return {uf: g["municipio"].tolist() for uf, g in tabela.groupby("uf", sort=False)}
+        except Exception:
+            return _load_one("municipios_por_uf.json", {})
 
-    try:
-        with open("condicoes_metereologicas_options.json", "r", encoding="utf-8") as f:
-            condicoes = json.load(f)
-    except Exception:
-        # Padrão de opções de clima simplificadas (Baseado na lógica de _simplificar_clima)
-        condicoes = ["Chuva", "Nublado", "Bom", "Vento", "Nevoeiro/Neblina", "Outro"]
+    # Os três arquivos são independentes — ler em paralelo corta a latência
+    # do cold start (o parser libera o GIL durante o I/O)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        futuros = [
+            executor.submit(_load_one, "uf_options.json", []),
+            executor.submit(_load_municipios),
+            # Padrão de opções de clima simplificadas (Baseado na lógica de _simplificar_clima)
+            executor.submit(_load_one, "condicoes_metereologicas_options.json",
+                            ["Chuva", "Nublado", "Bom", "Vento", "Nevoeiro/Neblina", "Outro"]),
+        ]
+        uf_options, municipios_por_uf, condicoes = [f.result() for f in futuros]
 
-    return uf_options, municipios_por_uf, condicoes
+    # Pré-computa os índices padrão uma única vez (memoizado pelo
+    # @st.cache_data): os .index()/'in' lineares saem do caminho de rerun,
+    # que roda a cada interação de widget
+    uf_default_idx = uf_options.index("PE") if "PE" in uf_options else 0
+    municipios_por_uf = {
+        uf: (lista, lista.index("RECIFE") if "RECIFE" in lista else 0)
+        for uf, lista in municipios_por_uf.items()
+    }
+
+    return uf_options, uf_default_idx, municipios_por_uf, condicoes
 
 # -------------------------
 # Função utilitária para determinar data automática
 # -------------------------
 def escolher_data_automatica(pred):
-    """Escolhe a próxima data de previsão."""
+    """Escolhe a próxima data de previsão (escalar cacheado no load_model)."""
     try:
-        hist = pred.historical_df
-        if isinstance(hist, pd.DataFrame) and "data" in hist.columns and not hist.empty:
-            hist_datas = pd.to_datetime(hist["data"], errors='coerce')
-            ultima = hist_datas.max()
-            if pd.notna(ultima):
-                proxima = (ultima + pd.Timedelta(days=1)).date()
-                return proxima.strftime("%d/%m/%Y")
+        ultima = getattr(pred, "_last_hist_date", None)
+        if ultima is not None:
+            proxima = (ultima + pd.Timedelta(days=1)).date()
+            return proxima.strftime("%d/%m/%Y")
     except Exception:
         pass
     # fallback: hoje
@@ -87,7 +157,7 @@ st.set_page_config(page_title="Preditor de Acidentes", layout="wide")
 st.title("🛣️ Preditor de Acidentes de Trânsito")
 
 predictor = load_model()
-uf_options, municipios_por_uf, condicoes_options = load_options()
+uf_options, uf_default_idx, municipios_por_uf, condicoes_options = load_options()
 
 if not predictor:
     st.warning("Modelo não carregado. Verifique o arquivo 'modelo_acidentes.pkl'.")
@@ -107,11 +177,11 @@ with st.container():
     c1, c2, c3 = st.columns(3)
 
     with c1:
-        uf = st.selectbox("UF", uf_options, index=uf_options.index("PE") if "PE" in uf_options else 0)
-    
+        uf = st.selectbox("UF", uf_options, index=uf_default_idx)
+
     with c2:
-        municipios_filtrados = municipios_por_uf.get(uf, ["DESCONHECIDO"]) if municipios_por_uf else ["DESCONHECIDO"]
-        municipio = st.selectbox("Município", municipios_filtrados, index=municipios_filtrados.index("RECIFE") if "RECIFE" in municipios_filtrados else 0)
+        municipios_filtrados, mun_default_idx = municipios_por_uf.get(uf, (["DESCONHECIDO"], 0))
+        municipio = st.selectbox("Município", municipios_filtrados, index=mun_default_idx)
     
     with c3:
         # Corrigido para permitir a escolha de qualquer horário
@@ -132,7 +202,9 @@ if st.button("Prever Acidentes", type="primary"):
         tipo_default = "DESCONHECIDO"
         if "tipo_acidente" in predictor.encoders:
             try:
-                tipo_default = predictor.encoders["tipo_acidente"].classes_[0]
+                enc = predictor.encoders["tipo_acidente"]
+                # modelos novos guardam um Index de categorias; antigos, um LabelEncoder
+                tipo_default = getattr(enc, "classes_", enc)[0]
             except Exception:
                 tipo_default = "DESCONHECIDO"
 
@@ -173,19 +245,18 @@ if st.button("Prever Acidentes", type="primary"):
             contexto_msgs = []
             
             # --- Cálculo da Média e Porcentagem de Risco ---
+            # (agregados pré-computados em load_model: só lookups por clique)
             ref = None
             try:
-                hist = predictor.historical_df
-                if isinstance(hist, pd.DataFrame) and "acidentes" in hist.columns:
-                    media_global = hist["acidentes"].mean()
-                    
-                    if "municipio" in hist.columns and municipio in hist["municipio"].unique():
-                        media_mun = hist.loc[hist["municipio"] == municipio, "acidentes"].mean()
+                if predictor._global_mean is not None:
+                    media_mun = predictor._mean_by_mun.get(municipio)
+
+                    if media_mun is not None:
                         contexto_msgs.append(f"Média histórica de acidentes em **{municipio}**: **{media_mun:.2f}** acidentes/dia.")
                         ref = media_mun
                     else:
-                        contexto_msgs.append(f"Média histórica geral (todos os municípios): **{media_global:.2f}** acidentes/dia.")
-                        ref = media_global
+                        contexto_msgs.append(f"Média histórica geral (todos os municípios): **{predictor._global_mean:.2f}** acidentes/dia.")
+                        ref = predictor._global_mean
 
                     # Comparação Percentual (o "Risco" em % da média)
                     if ref is not None and ref > 0:
@@ -201,14 +272,16 @@ if st.button("Prever Acidentes", type="primary"):
                          st.info("A média histórica de acidentes é zero neste contexto, não sendo possível a comparação percentual de risco.")
                     
                     # --- Histórico Recente ---
-                    if "data" in hist.columns:
-                        ult7 = hist.sort_values("data", ascending=False).head(7)[["data", "acidentes"]]
-                        ult7 = ult7.assign(data=lambda d: pd.to_datetime(d["data"], errors='coerce').dt.strftime("%d/%m/%Y"))
-                        
+                    if predictor._last7 is not None:
+                        ult7 = predictor._last7.dropna(subset=["data_str"])
+
                         st.markdown("---")
                         st.markdown("##### Histórico de Acidentes (Últimos 7 dias no *dataset*):")
-                        
-                        ult7_list = [f"- {row['data']}: **{int(row['acidentes'])}**" for _, row in ult7.iterrows() if pd.notna(row['data'])]
+
+                        ult7_list = (
+                            "- " + ult7["data_str"] + ": **"
+                            + ult7["acidentes"].astype(int).astype(str) + "**"
+                        ).tolist()
                         if ult7_list:
                              st.markdown("\n".join(ult7_list))
 
@@ -0,0 +1,26 @@
+# json_cache.py
+import os
+import json
+from functools import lru_cache
+
+# orjson decodifica em C e é ~3-5x mais rápido que o json da stdlib;
+# opcional, com fallback transparente
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def load_json_cached(path):
+    """Carrega um arquivo JSON reaproveitando o resultado enquanto o mtime não mudar.
+
+    O objeto retornado é compartilhado entre chamadas — tratar como somente-leitura.
+    """
+    return _load_json_impl(path, os.path.getmtime(path))
+
+@lru_cache(maxsize=32)
+def _load_json_impl(path, mtime):
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
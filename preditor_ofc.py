@@ -1,18 +1,37 @@
 import pandas as pd
 import numpy as np
-import json
+import re
+import math
 import pickle
 import lightgbm as lgb
 from datetime import datetime
-from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import r2_score, mean_squared_error
 import holidays
 import warnings
 import itertools
+from json_cache import load_json_cached
 
 warnings.filterwarnings("ignore")
 
 
+_LEAF_VALUE_RE = re.compile(r"(?m)^leaf_value=(.+)$")
+
+def _arredondar_leaf_values(model_str, casas=4):
+    """Arredonda os leaf_value do modelo serializado para `casas` decimais.
+
+    As previsões passam por np.round na saída, então a precisão extra dos
+    floats completos só inflaria o artefato serializado.
+    """
+    def _arredondar(m):
+        valores = " ".join(f"{round(float(v), casas):g}" for v in m.group(1).split())
+        return f"leaf_value={valores}"
+    compactado = _LEAF_VALUE_RE.sub(_arredondar, model_str)
+    # o cabeçalho tree_sizes guarda o tamanho em bytes de cada árvore, que o
+    # arredondamento invalida; sem ele o LightGBM delimita as árvores pelos
+    # marcadores Tree=
+    return re.sub(r"(?m)^tree_sizes=.*\n", "", compactado)
+
+
 class AccidentPredictor:
     def __init__(self):
         self.modelo = lgb.LGBMRegressor(random_state=42)
@@ -25,39 +44,85 @@ class AccidentPredictor:
         self.r2_score_test = None
         self.rmse_score_test = None
         self.holidays_br = holidays.Brazil()
+        self._holiday_cache = {}
+        self._encoder_luts = {}
+        self._booster = None
         self.historical_df = None
 
+    # regras compartilhadas pelos caminhos vetorizado e escalar
+    _CLIMA_REGRAS = [
+        ("Chuva|Garoa", "Chuva"),
+        ("Nublado", "Nublado"),
+        ("Céu Claro|Sol|Bom", "Bom"),
+        ("Vento", "Vento"),
+        ("Nevoeiro|Neblina", "Nevoeiro/Neblina"),
+    ]
+
     def _simplificar_clima(self, cond):
-        if any(k in cond for k in ["Chuva", "Garoa"]):
-            return "Chuva"
-        if "Nublado" in cond:
-            return "Nublado"
-        if any(k in cond for k in ["Céu Claro", "Sol", "Bom"]):
-            return "Bom"
-        if "Vento" in cond:
-            return "Vento"
-        if any(k in cond for k in ["Nevoeiro", "Neblina"]):
-            return "Nevoeiro/Neblina"
+        """Simplifica uma Series de condições meteorológicas em categorias amplas."""
+        s = cond.astype(str)
+        masks = [s.str.contains(padrao, regex=True) for padrao, _ in self._CLIMA_REGRAS]
+        return np.select(masks, [rotulo for _, rotulo in self._CLIMA_REGRAS], default="Outro")
+
+    def _simplificar_clima_valor(self, cond):
+        """Versão escalar de _simplificar_clima, para o caminho de linha única."""
+        texto = str(cond)
+        for padrao, rotulo in self._CLIMA_REGRAS:
+            if re.search(padrao, texto):
+                return rotulo
         return "Outro"
 
+    def _feriados_no_intervalo(self, ano_min, ano_max):
+        """Materializa os feriados nacionais do intervalo de anos (cacheado).
+
+        Uma consulta vetorizada via isin substitui o __contains__ da lib
+        holidays por linha.
+        """
+        key = (ano_min, ano_max)
+        if key not in self._holiday_cache:
+            anos = range(ano_min, ano_max + 1)
+            self._holiday_cache[key] = pd.to_datetime(
+                [d for ano in anos for d in holidays.Brazil(years=ano).keys()]
+            )
+        return self._holiday_cache[key]
+
     def _processar_dados(self, df):
         df["data"] = pd.to_datetime(df["data_inversa"], format="%d/%m/%Y", errors="coerce")
-        df = df[df["data"].dt.year >= 2019].dropna(subset=["data", "horario", "uf", "municipio", "tipo_acidente", "condicao_metereologica"])
+        # máscara única (ano + obrigatórias não-nulas): um filtro e uma cópia
+        # em vez de dois frames intermediários
+        obrigatorias = ["data", "horario", "uf", "municipio", "tipo_acidente", "condicao_metereologica"]
+        mask = (df["data"].dt.year >= 2019) & df[obrigatorias].notna().all(axis=1)
+        df = df.loc[mask].copy()
         df["hora"] = pd.to_datetime(df["horario"], format="%H:%M:%S", errors="coerce").dt.hour
         df.dropna(subset=["hora"], inplace=True)
-        df["condicao_metereologica"] = df["condicao_metereologica"].apply(self._simplificar_clima)
-
-        agg = df.groupby("data").agg(
-            acidentes=("data_inversa", "count"),
-            uf=("uf", lambda x: x.mode()[0]),
-            municipio=("municipio", lambda x: x.mode()[0]),
-            tipo_acidente=("tipo_acidente", lambda x: x.mode()[0]),
-            condicao_metereologica=("condicao_metereologica", lambda x: x.mode()[0]),
-            hora_media=("hora", "mean")
+        df["condicao_metereologica"] = self._simplificar_clima(df["condicao_metereologica"])
+
+        # category: os groupbys de moda abaixo passam a operar sobre códigos
+        # inteiros contíguos em vez de strings Python
+        for col in ["uf", "municipio", "tipo_acidente", "condicao_metereologica"]:
+            df[col] = df[col].astype("category")
+
+        def _moda_por_data(col):
+            # contagem (data, valor) + idxmax por data equivale a mode()[0]
+            # (menor valor em caso de empate), sem lambda Python por grupo;
+            # observed=True evita enumerar categorias não observadas por data
+            tamanhos = df.groupby(["data", col], observed=True).size()
+            return tamanhos.groupby(level=0).idxmax().str[1].rename(col)
+
+        agg = pd.concat(
+            [
+                df.groupby("data").size().rename("acidentes"),
+                _moda_por_data("uf"),
+                _moda_por_data("municipio"),
+                _moda_por_data("tipo_acidente"),
+                _moda_por_data("condicao_metereologica"),
+                df.groupby("data")["hora"].mean().rename("hora_media"),
+            ],
+            axis=1,
         ).reset_index()
 
-        agg["clima"] = agg["condicao_metereologica"].apply(self._simplificar_clima)
-        agg = agg.drop(columns=["condicao_metereologica"])
+        # a coluna já foi simplificada acima — basta renomear, sem segundo passe
+        agg = agg.rename(columns={"condicao_metereologica": "clima"})
         return agg.sort_values("data").reset_index(drop=True)
 
     def _criar_features(self, df):
@@ -67,7 +132,12 @@ class AccidentPredictor:
         df["dia_ano"] = df["data"].dt.dayofyear
         df["semana"] = df["data"].dt.isocalendar().week.astype(int)
         df["fim_semana"] = (df["dia_semana"] >= 5).astype(int)
-        df["feriado"] = df["data"].apply(lambda x: int(x in self.holidays_br))
+        anos_validos = df["ano"].dropna()
+        if anos_validos.empty:
+            df["feriado"] = 0
+        else:
+            feriados = self._feriados_no_intervalo(int(anos_validos.min()), int(anos_validos.max()))
+            df["feriado"] = df["data"].isin(feriados).astype(int)
         df["feriado_fim_semana"] = df["feriado"] * df["fim_semana"]
 
         df["dia_semana_sin"] = np.sin(2 * np.pi * df["dia_semana"] / 7)
@@ -78,9 +148,13 @@ class AccidentPredictor:
         if 'acidentes' in df.columns:
             for lag in [1, 2, 7, 14]:
                 df[f"lag_{lag}"] = df["acidentes"].shift(lag)
+            # um único shift(1) reaproveitado por todas as janelas; cada
+            # Rolling serve mean e std sem re-percorrer a série
+            deslocado = df["acidentes"].shift(1)
             for w in [7, 14, 28]:
-                df[f"media_{w}"] = df["acidentes"].shift(1).rolling(w, min_periods=1).mean()
-                df[f"std_{w}"] = df["acidentes"].shift(1).rolling(w, min_periods=1).std()
+                janela = deslocado.rolling(w, min_periods=1)
+                df[f"media_{w}"] = janela.mean()
+                df[f"std_{w}"] = janela.std()
         else:
             for lag in [1, 2, 7, 14]:
                 df[f"lag_{lag}"] = 0
@@ -93,12 +167,19 @@ class AccidentPredictor:
         for col in ["uf", "municipio", "tipo_acidente", "clima"]:
             if col in df.columns:
                 if col in self.encoders:
-                    enc = self.encoders[col]
-                    df.loc[:, f"{col}_enc"] = df[col].apply(lambda x: enc.transform([x])[0] if x in enc.classes_ else -1)
+                    # codifica contra as categorias salvas: desconhecidos
+                    # viram -1 automaticamente
+                    categorias = self.encoders[col]
+                    # pickles antigos guardam um LabelEncoder; usa suas classes
+                    categorias = getattr(categorias, "classes_", categorias)
+                    codigos = pd.Categorical(df[col], categories=categorias).codes
+                    df.loc[:, f"{col}_enc"] = codigos.astype(np.int32)
                 else:
-                    enc = LabelEncoder()
-                    df.loc[:, f"{col}_enc"] = enc.fit_transform(df[col])
-                    self.encoders[col] = enc
+                    # o ajuste vira um astype: categorias ordenadas como o
+                    # LabelEncoder ordenava as classes
+                    cat = pd.Categorical(df[col])
+                    df.loc[:, f"{col}_enc"] = cat.codes.astype(np.int32)
+                    self.encoders[col] = cat.categories
             else:
                 df.loc[:, f"{col}_enc"] = 0
 
@@ -115,8 +196,9 @@ class AccidentPredictor:
         return df[features], y
 
     def treinar(self, arquivo_json):
-        with open(arquivo_json, "r", encoding="utf-8") as f:
-            df = pd.DataFrame(json.load(f))
+        # json_cache usa orjson quando disponível — parser nativo, o maior
+        # custo de carga do consolidado — com fallback transparente à stdlib
+        df = pd.DataFrame(load_json_cached(arquivo_json))
 
         df = self._processar_dados(df)
         self.historical_df = df.copy() # Salva o df agregado para usar no contexto histórico
@@ -144,23 +226,96 @@ class AccidentPredictor:
         print(f"Treino (70%): R²={self.r2_score_train:.4f}, RMSE={self.rmse_score_train:.2f}")
         print(f"Teste  (30%): R²={self.r2_score_test:.4f}, RMSE={self.rmse_score_test:.2f}")
 
-    def salvar_modelo(self, nome="modelo_acidentes.pkl"):
+    def salvar_modelo(self, nome="modelo_acidentes.pkl", historico="historico_acidentes.parquet"):
         if not self.treinado:
             raise RuntimeError("Treine o modelo antes de salvar.")
 
+        payload = {
+            # só o estado essencial à inferência: o Booster nativo, sem o
+            # wrapper sklearn nem metadados de treino, com folhas compactadas
+            "booster_str": _arredondar_leaf_values(self.modelo.booster_.model_to_string()),
+            "encoders": self.encoders,
+            "features": self.feature_names,
+            "r2_train": self.r2_score_train,
+            "rmse_train": self.rmse_score_train,
+            "r2_test": self.r2_score_test,
+            "rmse_test": self.rmse_score_test,
+        }
+
+        # Histórico fora do pickle: Parquet colunar, carregado sob demanda na
+        # interface. Se não houver engine parquet disponível, embute como antes.
+        # A coluna data sai normalizada como datetime64 — a UI não precisa
+        # re-parsear nada no load nem por clique.
+        hist_out = self.historical_df
+        if hist_out is not None and "data" in hist_out.columns and \
+                not pd.api.types.is_datetime64_any_dtype(hist_out["data"]):
+            hist_out = hist_out.assign(data=pd.to_datetime(hist_out["data"], errors="coerce"))
+        try:
+            hist_out.to_parquet(historico)
+            payload["historical_path"] = historico
+        except Exception:
+            payload["historical_df"] = hist_out
+
         with open(nome, "wb") as f:
-            pickle.dump({
-                "modelo": self.modelo,
-                "encoders": self.encoders,
-                "features": self.feature_names,
-                "r2_train": self.r2_score_train,
-                "rmse_train": self.rmse_score_train,
-                "r2_test": self.r2_score_test,
-                "rmse_test": self.rmse_score_test,
-                "historical_df": self.historical_df
-            }, f)
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
         print(f"Modelo salvo: {nome}")
         
+    def _get_booster(self):
+        """Booster nativo do modelo (com ou sem o wrapper sklearn), cacheado."""
+        if self._booster is None:
+            self._booster = getattr(self.modelo, "booster_", self.modelo)
+        return self._booster
+
+    def _lut_encoder(self, col):
+        """LUT valor->código de um encoder, montada uma vez e cacheada."""
+        if col not in self._encoder_luts:
+            categorias = self.encoders.get(col)
+            if categorias is None:
+                self._encoder_luts[col] = {}
+            else:
+                categorias = getattr(categorias, "classes_", categorias)
+                self._encoder_luts[col] = {c: i for i, c in enumerate(categorias)}
+        return self._encoder_luts[col]
+
+    def _features_single(self, registro):
+        """Monta o vetor (1, n_features) float32 de um único registro.
+
+        O caminho interativo prevê uma linha por clique; lags e janelas são 0
+        por construção, então todo o pipeline pandas pode ser pulado.
+        """
+        data = datetime.strptime(registro["data_inversa"], "%d/%m/%Y")
+        dia_semana = data.weekday()
+        dia_ano = data.timetuple().tm_yday
+        fim_semana = 1 if dia_semana >= 5 else 0
+        feriado = 1 if data in self.holidays_br else 0
+
+        valores = {
+            "ano": data.year,
+            "mes": data.month,
+            "dia_semana": dia_semana,
+            "dia_ano": dia_ano,
+            "semana": data.isocalendar()[1],
+            "fim_semana": fim_semana,
+            "dia_semana_sin": math.sin(2 * math.pi * dia_semana / 7),
+            "dia_semana_cos": math.cos(2 * math.pi * dia_semana / 7),
+            "dia_ano_sin": math.sin(2 * math.pi * dia_ano / 365.25),
+            "dia_ano_cos": math.cos(2 * math.pi * dia_ano / 365.25),
+            "hora_media": float(registro.get("hora_media", 0) or 0),
+            "feriado": feriado,
+            "feriado_fim_semana": feriado * fim_semana,
+            "uf_enc": self._lut_encoder("uf").get(registro.get("uf"), -1),
+            "municipio_enc": self._lut_encoder("municipio").get(registro.get("municipio"), -1),
+            "tipo_acidente_enc": self._lut_encoder("tipo_acidente").get(registro.get("tipo_acidente"), -1),
+            "clima_enc": self._lut_encoder("clima").get(
+                self._simplificar_clima_valor(registro.get("condicao_metereologica", "")), -1
+            ),
+        }
+
+        x = np.zeros((1, len(self.feature_names)), dtype=np.float32)
+        for j, nome in enumerate(self.feature_names):
+            x[0, j] = valores.get(nome, 0.0)
+        return x
+
     def prever(self, df_input):
         """
         Realiza a previsão em um novo DataFrame de input (não-agregado).
@@ -168,21 +323,41 @@ class AccidentPredictor:
         """
         if not self.treinado:
             raise RuntimeError("O modelo não foi treinado.")
-        
-        # 1. Copia o DF de entrada
-        df = df_input.copy()
-        
-        # 2. Adiciona colunas para feature engineering
-        df["data"] = pd.to_datetime(df["data_inversa"], format="%d/%m/%Y", errors="coerce")
-        df["clima"] = df["condicao_metereologica"].apply(self._simplificar_clima)
-        
-        # 3. Cria as features com base na lógica de treinamento
+
+        # Caminho rápido interativo: uma linha dispensa o pipeline pandas e
+        # o pool de threads do LightGBM (que só atrapalha com n=1)
+        if len(df_input) == 1:
+            registro = df_input.iloc[0].to_dict()
+            try:
+                x = self._features_single(registro)
+            except Exception:
+                # input malformado (ex.: data inválida): o caminho batch
+                # coage com errors='coerce' em vez de propagar
+                x = None
+            if x is not None:
+                resultado = self._get_booster().predict(
+                    x, num_threads=1, predict_disable_shape_check=True
+                )
+                return np.clip(np.round(resultado), 0, None).astype(int)
+
+        # 1. Monta direto o frame estreito que o feature engineering consome,
+        #    em vez de copiar o input inteiro e ir adicionando colunas nele
+        df = pd.DataFrame({
+            "data": pd.to_datetime(df_input["data_inversa"], format="%d/%m/%Y", errors="coerce"),
+            "clima": self._simplificar_clima(df_input["condicao_metereologica"]),
+            "uf": df_input["uf"],
+            "municipio": df_input["municipio"],
+            "tipo_acidente": df_input["tipo_acidente"],
+            "hora_media": df_input.get("hora_media", 0),
+        })
+
+        # 2. Cria as features com base na lógica de treinamento
         X_input, _ = self._criar_features(df)
-        
-        # 4. Filtra apenas as features que o modelo espera e prevê
-        X_predict = X_input[self.feature_names]
 
-        # 5. Previsão
+        # 3. Filtra as features que o modelo espera, já como float32 contíguo
+        X_predict = X_input[self.feature_names].to_numpy(dtype=np.float32)
+
+        # 4. Previsão
         resultado = self.modelo.predict(X_predict)
         
         # Arredonda e garante que não é negativo